@@ -17,12 +17,10 @@
 
 import functools
 import inspect
-import itertools
 import logging
+import queue
 import threading
 
-from six.moves import queue
-
 
 class Icon(object):
     """A representation of a system tray icon.
@@ -440,13 +438,13 @@ class MenuItem(object):
             self, text, action, checked=None, radio=False, default=False,
             visible=True, enabled=True):
         self.__name__ = str(text)
-        self._text = self._wrap(text or '')
+        self._text = text or ''
         self._action = self._assert_action(action)
-        self._checked = self._assert_callable(checked, lambda _: None)
-        self._radio = self._wrap(radio)
-        self._default = self._wrap(default)
-        self._visible = self._wrap(visible)
-        self._enabled = self._wrap(enabled)
+        self._checked = self._assert_callable(checked, None)
+        self._radio = radio
+        self._default = default
+        self._visible = visible
+        self._enabled = enabled
 
     def __call__(self, icon):
         if not isinstance(self._action, Menu):
@@ -462,7 +460,7 @@ class MenuItem(object):
     def text(self):
         """The menu item text.
         """
-        return self._text(self)
+        return self._text(self) if callable(self._text) else self._text
 
     @property
     def checked(self):
@@ -475,7 +473,7 @@ class MenuItem(object):
         Depending on platform, uncheckable items may be rendered differently
         from unchecked items.
         """
-        return self._checked(self)
+        return self._checked(self) if self._checked is not None else None
 
     @property
     def radio(self):
@@ -485,7 +483,7 @@ class MenuItem(object):
         for uncheckable items.
         """
         if self.checked is not None:
-            return self._radio(self)
+            return self._radio(self) if callable(self._radio) else self._radio
         else:
             return False
 
@@ -493,7 +491,8 @@ class MenuItem(object):
     def default(self):
         """Whether this is the default menu item.
         """
-        return self._default(self)
+        return self._default(self) if callable(self._default) \
+            else self._default
 
     @property
     def visible(self):
@@ -502,16 +501,19 @@ class MenuItem(object):
         If the action for this menu item is a menu, that also has to be visible
         for this property to be ``True``.
         """
+        visible = self._visible(self) if callable(self._visible) \
+            else self._visible
         if isinstance(self._action, Menu):
-            return self._visible(self) and self._action.visible
+            return visible and self._action.visible
         else:
-            return self._visible(self)
+            return visible
 
     @property
     def enabled(self):
         """Whether this menu item is enabled.
         """
-        return self._enabled(self)
+        return self._enabled(self) if callable(self._enabled) \
+            else self._enabled
 
     @property
     def submenu(self):
@@ -569,10 +571,9 @@ class MenuItem(object):
 
         :param value: The callable to check.
 
-        :param callable default: The default value to return if ``value`` is
-            ``None``
+        :param default: The default value to return if ``value`` is ``None``.
 
-        :return: a callable
+        :return: a callable, or ``default``
         """
         if value is None:
             return default
@@ -581,15 +582,6 @@ class MenuItem(object):
         else:
             raise ValueError(value)
 
-    def _wrap(self, value):
-        """Wraps a value in a callable.
-
-        If the value already is a callable, it is returned unmodified
-
-        :param value: The value or callable to wrap.
-        """
-        return value if callable(value) else lambda _: value
-
 
 class Menu(object):
     """A description of a menu.
@@ -607,17 +599,24 @@ class Menu(object):
     SEPARATOR = MenuItem('- - - -', None)
 
     def __init__(self, *items):
-        self._items = tuple(items)
+        # A single callable that is not a menu item is a factory for the items;
+        # this is determined once here rather than on every access
+        if (True
+                and len(items) == 1
+                and not isinstance(items[0], MenuItem)
+                and callable(items[0])):
+            self._factory = items[0]
+            self._items = ()
+        else:
+            self._factory = None
+            self._items = tuple(items)
 
     @property
     def items(self):
         """All menu items.
         """
-        if (True
-                and len(self._items) == 1
-                and not isinstance(self._items[0], MenuItem)
-                and callable(self._items[0])):
-            return self._items[0]()
+        if self._factory is not None:
+            return self._factory()
         else:
             return self._items
 
@@ -659,24 +658,26 @@ class Menu(object):
 
         :return: a tuple containing all currently visible items
         """
-        def cleaned(items):
-            was_separator = False
-            for i in items:
-                if not i.visible:
-                    continue
+        separator = self.SEPARATOR
+        items = []
 
-                if i is self.SEPARATOR:
-                    if was_separator:
-                        continue
-                    was_separator = True
-                else:
-                    was_separator = False
-                yield i
+        # Start as if following a separator to drop any leading separators
+        was_separator = True
+        for i in self.items:
+            if not i.visible:
+                continue
 
-        def strip_head(items):
-            return itertools.dropwhile(lambda i: i is self.SEPARATOR, items)
+            if i is separator:
+                if was_separator:
+                    continue
+                was_separator = True
+            else:
+                was_separator = False
+            items.append(i)
 
-        def strip_tail(items):
-            return reversed(list(strip_head(reversed(list(items)))))
+        # Consecutive separators have been reduced to one, so at most a single
+        # trailing separator remains
+        if was_separator and items:
+            items.pop()
 
-        return tuple(strip_tail(strip_head(cleaned(self.items))))
+        return tuple(items)
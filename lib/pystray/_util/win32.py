@@ -19,10 +19,13 @@ import ctypes
 
 from ctypes import wintypes
 
-windll = ctypes.LibraryLoader(ctypes.WinDLL)
+kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+shell32 = ctypes.WinDLL('shell32', use_last_error=True)
+user32 = ctypes.WinDLL('user32', use_last_error=True)
 
 
 WM_CREATE = 0x0001
+WM_QUIT = 0x0012
 WM_DISPLAYCHANGE = 0x007E
 WM_NCCREATE = 0x0081
 WM_LBUTTONUP = 0x0202
@@ -103,19 +106,32 @@ TPM_VERTICAL = 0x0040
 
 WS_POPUP = 0x80000000
 
+MWMO_INPUTAVAILABLE = 0x0004
+
+QS_ALLINPUT = 0x04FF
+
+INFINITE = 0xFFFFFFFF
+WAIT_FAILED = 0xFFFFFFFF
+
 
 PM_NOREMOVE = 0
+PM_REMOVE = 1
 COLOR_WINDOW = 5
 HWND_MESSAGE = -3
 IMAGE_ICON = 1
 
+#: The icon format version passed to ``CreateIconFromResourceEx``
+ICON_RESOURCE_VERSION = 0x00030000
+
+
+LRESULT = wintypes.LPARAM
 
 LPMSG = ctypes.POINTER(wintypes.MSG)
 
 LPPOINT = ctypes.POINTER(wintypes.POINT)
 
 WNDPROC = ctypes.WINFUNCTYPE(
-    ctypes.HRESULT,
+    LRESULT,
     wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
 
 
@@ -136,6 +152,8 @@ class MENUITEMINFO(ctypes.Structure):
 
 LPMENUITEMINFO = ctypes.POINTER(MENUITEMINFO)
 
+SIZEOF_MENUITEMINFO = ctypes.sizeof(MENUITEMINFO)
+
 
 class NOTIFYICONDATAW(ctypes.Structure):
     class VERSION_OR_TIMEOUT(ctypes.Union):
@@ -172,6 +190,8 @@ class NOTIFYICONDATAW(ctypes.Structure):
 
 LPNOTIFYICONDATAW = ctypes.POINTER(NOTIFYICONDATAW)
 
+SIZEOF_NOTIFYICONDATAW = ctypes.sizeof(NOTIFYICONDATAW)
+
 
 class TPMPARAMS(ctypes.Structure):
     _fields_ = [
@@ -201,21 +221,30 @@ def _err(result, func, arguments):
     """A *ctypes* ``errchecker`` that ensures truthy values.
     """
     if not result:
-        raise ctypes.WinError()
+        raise ctypes.WinError(ctypes.get_last_error())
     else:
         return result
 
 
 LPWNDCLASSEX = ctypes.POINTER(WNDCLASSEX)
 
+SIZEOF_WNDCLASSEX = ctypes.sizeof(WNDCLASSEX)
+
 
-CreatePopupMenu = windll.user32.CreatePopupMenu
+CreateIconFromResourceEx = user32.CreateIconFromResourceEx
+CreateIconFromResourceEx.argtypes = (
+    ctypes.c_char_p, wintypes.DWORD, wintypes.BOOL, wintypes.DWORD,
+    wintypes.INT, wintypes.INT, wintypes.UINT)
+CreateIconFromResourceEx.restype = wintypes.HICON
+CreateIconFromResourceEx.errcheck = _err
+
+CreatePopupMenu = user32.CreatePopupMenu
 CreatePopupMenu.argtypes = ()
 CreatePopupMenu.restype = wintypes.HMENU
 CreatePopupMenu.errcheck = _err
 
 
-CreateWindowEx = windll.user32.CreateWindowExW
+CreateWindowEx = user32.CreateWindowExW
 CreateWindowEx.argtypes = (
     wintypes.DWORD, wintypes.ATOM, wintypes.LPCWSTR, wintypes.DWORD,
     wintypes.INT, wintypes.INT, wintypes.INT, wintypes.INT, wintypes.HWND,
@@ -223,112 +252,131 @@ CreateWindowEx.argtypes = (
 CreateWindowEx.restype = wintypes.HWND
 CreateWindowEx.errcheck = _err
 
-DefWindowProc = windll.user32.DefWindowProcW
+DefWindowProc = user32.DefWindowProcW
 DefWindowProc.argtypes = (
     wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
-DefWindowProc.restype = wintypes.DWORD
+DefWindowProc.restype = LRESULT
 
-DestroyIcon = windll.user32.DestroyIcon
+DestroyIcon = user32.DestroyIcon
 DestroyIcon.argtypes = (
     wintypes.HICON,)
 DestroyIcon.restype = wintypes.BOOL
 DestroyIcon.errcheck = _err
 
-DestroyMenu = windll.user32.DestroyMenu
+DestroyMenu = user32.DestroyMenu
 DestroyMenu.argtypes = (
     wintypes.HMENU,)
 DestroyMenu.restype = wintypes.BOOL
 DestroyMenu.errcheck = _err
 
-DestroyWindow = windll.user32.DestroyWindow
+DestroyWindow = user32.DestroyWindow
 DestroyWindow.argtypes = (
     wintypes.HWND,)
 DestroyWindow.restype = wintypes.BOOL
 DestroyWindow.errcheck = _err
 
-DispatchMessage = windll.user32.DispatchMessageW
+DispatchMessage = user32.DispatchMessageW
 DispatchMessage.argtypes = (
     LPMSG,)
-DispatchMessage.restype = wintypes.DWORD
+DispatchMessage.restype = LRESULT
 
-GetCursorPos = windll.user32.GetCursorPos
+GetCursorPos = user32.GetCursorPos
 GetCursorPos.argtypes = (
     LPPOINT,)
 GetCursorPos.restype = wintypes.BOOL
 GetCursorPos.errcheck = _err
 
-GetMessage = windll.user32.GetMessageW
+GetMessage = user32.GetMessageW
 GetMessage.argtypes = (
     LPMSG, wintypes.HWND, wintypes.UINT, wintypes.UINT)
 GetMessage.restype = wintypes.BOOL
 
-GetModuleHandle = windll.kernel32.GetModuleHandleW
+GetModuleHandle = kernel32.GetModuleHandleW
 GetModuleHandle.argtypes = (
     wintypes.LPCWSTR,)
 GetModuleHandle.restype = wintypes.HMODULE
 GetModuleHandle.errcheck = _err
 
-InsertMenuItem = windll.user32.InsertMenuItemW
+InsertMenuItem = user32.InsertMenuItemW
 InsertMenuItem.argtypes = (
     wintypes.HMENU, wintypes.UINT, wintypes.BOOL, LPMENUITEMINFO)
 InsertMenuItem.restype = wintypes.BOOL
-InsertMenuItem.errcheck = _err
 
-LoadImage = windll.user32.LoadImageW
+LoadImage = user32.LoadImageW
 LoadImage.argtypes = (
     wintypes.HINSTANCE, wintypes.LPCWSTR, wintypes.UINT, wintypes.INT,
     wintypes.INT, wintypes.UINT)
 LoadImage.restype = wintypes.HANDLE
 LoadImage.errcheck = _err
 
-PeekMessage = windll.user32.PeekMessageW
+LookupIconIdFromDirectoryEx = user32.LookupIconIdFromDirectoryEx
+LookupIconIdFromDirectoryEx.argtypes = (
+    ctypes.c_char_p, wintypes.BOOL, wintypes.INT, wintypes.INT,
+    wintypes.UINT)
+LookupIconIdFromDirectoryEx.restype = wintypes.INT
+LookupIconIdFromDirectoryEx.errcheck = _err
+
+MsgWaitForMultipleObjectsEx = user32.MsgWaitForMultipleObjectsEx
+MsgWaitForMultipleObjectsEx.argtypes = (
+    wintypes.DWORD, wintypes.LPHANDLE, wintypes.DWORD, wintypes.DWORD,
+    wintypes.DWORD)
+MsgWaitForMultipleObjectsEx.restype = wintypes.DWORD
+
+PeekMessage = user32.PeekMessageW
 PeekMessage.argtypes = (
     LPMSG, wintypes.HWND, wintypes.UINT, wintypes.UINT, wintypes.UINT)
 PeekMessage.restype = wintypes.BOOL
 
-PostMessage = windll.user32.PostMessageW
+PostMessage = user32.PostMessageW
 PostMessage.argtypes = (
     wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
 PostMessage.restype = wintypes.BOOL
-PostMessage.restype = wintypes.BOOL
 
-PostQuitMessage = windll.user32.PostQuitMessage
+PostQuitMessage = user32.PostQuitMessage
 PostQuitMessage.argtypes = (
     wintypes.INT,)
+PostQuitMessage.restype = None
 
-RegisterClassEx = windll.user32.RegisterClassExW
+RegisterClassEx = user32.RegisterClassExW
 RegisterClassEx.argtypes = (
     LPWNDCLASSEX,)
 RegisterClassEx.restype = wintypes.ATOM
 RegisterClassEx.errcheck = _err
 
-SetForegroundWindow = windll.user32.SetForegroundWindow
+SetForegroundWindow = user32.SetForegroundWindow
 SetForegroundWindow.argtypes = (
     wintypes.HWND,)
 SetForegroundWindow.restype = wintypes.BOOL
 
-Shell_NotifyIcon = windll.shell32.Shell_NotifyIconW
+SetMenuItemInfo = user32.SetMenuItemInfoW
+SetMenuItemInfo.argtypes = (
+    wintypes.HMENU, wintypes.UINT, wintypes.BOOL, LPMENUITEMINFO)
+SetMenuItemInfo.restype = wintypes.BOOL
+SetMenuItemInfo.errcheck = _err
+
+Shell_NotifyIcon = shell32.Shell_NotifyIconW
 Shell_NotifyIcon.argtypes = (
     wintypes.DWORD, LPNOTIFYICONDATAW)
 Shell_NotifyIcon.restype = wintypes.BOOL
 
-TranslateMessage = windll.user32.TranslateMessage
+TranslateMessage = user32.TranslateMessage
 TranslateMessage.argtypes = (
     LPMSG,)
 TranslateMessage.restype = wintypes.BOOL
 
-TrackPopupMenuEx = windll.user32.TrackPopupMenuEx
+TrackPopupMenuEx = user32.TrackPopupMenuEx
 TrackPopupMenuEx.argtypes = (
     wintypes.HMENU, wintypes.UINT, wintypes.INT, wintypes.INT, wintypes.HWND,
     LPTPMPARAMS)
+TrackPopupMenuEx.restype = wintypes.BOOL
 
-UnregisterClass = windll.user32.UnregisterClassW
+UnregisterClass = user32.UnregisterClassW
 UnregisterClass.argtypes = (
     wintypes.ATOM, wintypes.HINSTANCE)
 UnregisterClass.restype = wintypes.BOOL
 UnregisterClass.errcheck = _err
 
-RegisterWindowMessage = windll.user32.RegisterWindowMessageW
+RegisterWindowMessage = user32.RegisterWindowMessageW
 RegisterWindowMessage.argtypes = (
     wintypes.LPCWSTR,)
 RegisterWindowMessage.restype = wintypes.UINT
@@ -337,10 +385,13 @@ RegisterWindowMessage.errcheck = _err
 #: The message broadcast to top-level windows on Explorer restart
 WM_TASKBARCREATED = RegisterWindowMessage('TaskbarCreated')
 
+#: The handle of the module used to create the current process
+HINSTANCE = GetModuleHandle(None)
+
 # Ensure that we receive WM_TASKBARCREATED even when running with elevated
 # privileges
 try:
-    ChangeWindowMessageFilterEx = windll.user32.ChangeWindowMessageFilterEx
+    ChangeWindowMessageFilterEx = user32.ChangeWindowMessageFilterEx
 
     ChangeWindowMessageFilterEx.argtypes = (
         wintypes.HWND, wintypes.UINT, wintypes.DWORD, wintypes.LPVOID)
@@ -15,53 +15,74 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import collections
 import ctypes
+import hashlib
+import io
+import itertools
+import struct
 import threading
+import weakref
 
 from ctypes import wintypes
-from six.moves import queue
 
-from ._util import serialized_image, win32
+from ._util import win32
 from . import _base
 
 
 class Icon(_base.Icon):
-    _HWND_TO_ICON = {}
+    #: A mapping from window handle to icon; the running thread keeps the icon
+    #: alive, so this mapping must not
+    _HWND_TO_ICON = weakref.WeakValueDictionary()
+
+    #: The source of the identifiers passed as ``uID`` to the shell
+    _ICON_IDS = itertools.count(1)
+
+    #: The maximum number of icon handles kept for previously used images
+    _ICON_CACHE_SIZE = 8
 
     def __init__(self, *args, **kwargs):
         super(Icon, self).__init__(*args, **kwargs)
 
+        self._id = next(self._ICON_IDS) & 0xFFFFFFFF
         self._atom = self._register_class()
         self._icon_handle = None
+        self._icon_key = None
+        self._icon_cache = collections.OrderedDict()
+        self._title_buffer = None
+        self._notify_data = win32.NOTIFYICONDATAW(
+            cbSize=win32.SIZEOF_NOTIFYICONDATAW,
+            uID=self._id,
+            uCallbackMessage=win32.WM_NOTIFY)
+        self._notify_data_lock = threading.RLock()
         self._hwnd = None
         self._menu_hwnd = None
         self._hmenu = None
+        self._menu_handle = None
+        self._menu_state = None
 
-        # This is a mapping from win32 event codes to handlers used by the
-        # mainloop
-        self._message_handlers = {
-            win32.WM_DISPLAYCHANGE: self._on_display_change,
-            win32.WM_STOP: self._on_stop,
-            win32.WM_NOTIFY: self._on_notify,
-            win32.WM_TASKBARCREATED: self._on_taskbarcreated}
-
-        self._queue = queue.Queue()
+        #: The handlers for ``WM_STOP`` and ``WM_NOTIFY``, indexed by the offset
+        #: of the message from ``WM_STOP``
+        self._handlers = (
+            self._on_stop,
+            self._on_notify)
 
     def __del__(self):
         if self._running:
             self._stop()
             if self._thread.ident != threading.current_thread().ident:
                 self._thread.join()
-        self._release_icon()
+        with self._notify_data_lock:
+            self._release_icon()
 
     def _show(self):
-        self._assert_icon_handle()
-        self._message(
-            win32.NIM_ADD,
-            win32.NIF_MESSAGE | win32.NIF_ICON | win32.NIF_TIP,
-            uCallbackMessage=win32.WM_NOTIFY,
-            hIcon=self._icon_handle,
-            szTip=self.title)
+        # The icon handle may be destroyed when the cache is updated, so it
+        # must not change while another thread is passing it to the shell
+        with self._notify_data_lock:
+            self._assert_icon_handle()
+            self._message(
+                win32.NIM_ADD,
+                win32.NIF_MESSAGE | win32.NIF_ICON | win32.NIF_TIP)
 
     def _hide(self):
         self._message(
@@ -69,56 +90,69 @@ class Icon(_base.Icon):
             0)
 
     def _update_icon(self):
-        self._release_icon()
-        self._assert_icon_handle()
-        self._message(
-            win32.NIM_MODIFY,
-            win32.NIF_ICON,
-            hIcon=self._icon_handle)
+        with self._notify_data_lock:
+            previous = self._icon_handle
+            self._assert_icon_handle()
+            if self._icon_handle != previous:
+                self._message(
+                    win32.NIM_MODIFY,
+                    win32.NIF_ICON)
         self._icon_valid = True
 
     def _update_title(self):
         self._message(
             win32.NIM_MODIFY,
-            win32.NIF_TIP,
-            szTip=self.title)
+            win32.NIF_TIP)
 
     def _notify(self, message, title=None):
-        self._message(
-            win32.NIM_MODIFY,
-            win32.NIF_INFO,
-            szInfo=message,
-            szInfoTitle=title or self.title or '')
+        with self._notify_data_lock:
+            self._notify_data.szInfo = message
+            self._notify_data.szInfoTitle = title or self.title or ''
+            self._message(
+                win32.NIM_MODIFY,
+                win32.NIF_INFO)
 
     def _remove_notification(self):
-        self._message(
-            win32.NIM_MODIFY,
-            win32.NIF_INFO,
-            szInfo='')
+        with self._notify_data_lock:
+            self._notify_data.szInfo = ''
+            self._message(
+                win32.NIM_MODIFY,
+                win32.NIF_INFO)
 
     def _update_menu(self):
+        # Rebuilding the native menu is only required if the menu has changed
+        menu_state = self._resolve_menu(self.menu)
+        if menu_state == self._menu_state:
+            return
+
+        # If only the text or state of items has changed, update them in place
+        if self._menu_handle and self._menu_layout(menu_state) \
+                == self._menu_layout(self._menu_state):
+            hmenu, callbacks = self._menu_handle
+            self._update_menu_items(
+                hmenu, self._menu_state, menu_state, itertools.count(1))
+            self._menu_state = menu_state
+            return
+
         try:
             hmenu, callbacks = self._menu_handle
             win32.DestroyMenu(hmenu)
         except:
             pass
 
-        callbacks = []
-        hmenu = self._create_menu(self.menu, callbacks)
+        callbacks = {}
+        hmenu = self._create_menu(menu_state, callbacks)
         if hmenu:
             self._menu_handle = (hmenu, callbacks)
         else:
             self._menu_handle = None
+        self._menu_state = menu_state
 
     def _run(self):
-        # Create the message loop
-        msg = wintypes.MSG()
-        lpmsg = ctypes.byref(msg)
-        win32.PeekMessage(
-            lpmsg, None, win32.WM_USER, win32.WM_USER, win32.PM_NOREMOVE)
-
+        # Creating the windows also creates the message queue for this thread
         self._hwnd = self._create_window(self._atom)
         self._menu_hwnd = self._create_window(self._atom)
+        self._notify_data.hWnd = self._hwnd
         self._HWND_TO_ICON[self._hwnd] = self
 
         self._mark_ready()
@@ -138,20 +172,37 @@ class Icon(_base.Icon):
 
         This method retrieves all events from *Windows* and makes sure to
         dispatch clicks.
+
+        Instead of retrieving one message per wait, the thread waits until
+        input is available and then drains the entire message queue before
+        waiting again.
         """
-        # Pump messages
+        # Pump messages; the functions are bound to locals since they are
+        # called for every message
+        MsgWaitForMultipleObjectsEx = win32.MsgWaitForMultipleObjectsEx
+        PeekMessage = win32.PeekMessage
+        TranslateMessage = win32.TranslateMessage
+        DispatchMessage = win32.DispatchMessage
+        PM_REMOVE = win32.PM_REMOVE
+        WM_QUIT = win32.WM_QUIT
         try:
             msg = wintypes.MSG()
             lpmsg = ctypes.byref(msg)
             while True:
-                r = win32.GetMessage(lpmsg, None, 0, 0)
-                if not r:
-                    break
-                elif r == -1:
+                r = MsgWaitForMultipleObjectsEx(
+                    0,
+                    None,
+                    win32.INFINITE,
+                    win32.QS_ALLINPUT,
+                    win32.MWMO_INPUTAVAILABLE)
+                if r == win32.WAIT_FAILED:
                     break
-                else:
-                    win32.TranslateMessage(lpmsg)
-                    win32.DispatchMessage(lpmsg)
+
+                while PeekMessage(lpmsg, None, 0, 0, PM_REMOVE):
+                    if msg.message == WM_QUIT:
+                        return
+                    TranslateMessage(lpmsg)
+                    DispatchMessage(lpmsg)
 
         except:
             self._log.error(
@@ -181,6 +232,7 @@ class Icon(_base.Icon):
         if self.visible:
             self._hide()
             self._show()
+        return 0
 
     def _on_stop(self, wparam, lparam):
         """Handles ``WM_STOP``.
@@ -189,6 +241,7 @@ class Icon(_base.Icon):
         terminate.
         """
         win32.PostQuitMessage(0)
+        return 0
 
     def _on_notify(self, wparam, lparam):
         """Handles ``WM_NOTIFY``.
@@ -209,10 +262,10 @@ class Icon(_base.Icon):
             point = wintypes.POINT()
             win32.GetCursorPos(ctypes.byref(point))
 
-            # Display the menu and get the menu item identifier; the identifier
-            # is the menu item index
-            hmenu, descriptors = self._menu_handle
-            index = win32.TrackPopupMenuEx(
+            # Display the menu and get the menu item identifier; this is 0 if
+            # the menu was dismissed
+            hmenu, callbacks = self._menu_handle
+            identifier = win32.TrackPopupMenuEx(
                 hmenu,
                 win32.TPM_RIGHTALIGN | win32.TPM_BOTTOMALIGN
                 | win32.TPM_RETURNCMD,
@@ -220,8 +273,11 @@ class Icon(_base.Icon):
                 point.y,
                 self._menu_hwnd,
                 None)
-            if index > 0:
-                descriptors[index - 1](self)
+            callback = callbacks.get(identifier)
+            if callback is not None:
+                callback(self)
+
+        return 0
 
     def _on_taskbarcreated(self, wparam, lparam):
         """Handles ``WM_TASKBARCREATED``.
@@ -231,6 +287,7 @@ class Icon(_base.Icon):
         """
         if self.visible:
             self._show()
+        return 0
 
     def _create_window(self, atom):
         """Creates the system tray icon window.
@@ -249,7 +306,7 @@ class Icon(_base.Icon):
             0, 0, 0, 0,
             0,
             None,
-            win32.GetModuleHandle(None),
+            win32.HINSTANCE,
             None)
 
         # On Vista+, we must explicitly opt-in to receive WM_TASKBARCREATED
@@ -258,112 +315,300 @@ class Icon(_base.Icon):
             hwnd, win32.WM_TASKBARCREATED, win32.MSGFLT_ALLOW, None)
         return hwnd
 
-    def _create_menu(self, descriptors, callbacks):
-        """Creates a :class:`ctypes.wintypes.HMENU` from a
-        :class:`pystray.Menu` instance.
+    def _resolve_menu(self, descriptors):
+        """Resolves the current state of a :class:`pystray.Menu` instance.
 
-        :param descriptors: The menu descriptors. If this is falsy, ``None`` is
-            returned.
+        The menu items themselves are part of the state, since the callbacks
+        of the native menu refer to them.
 
-        :param callbacks: A list to which a callback is appended for every menu
-            item created. The menu item IDs correspond to the items in this
-            list plus one.
+        :param descriptors: The menu descriptors. If this is falsy, an empty
+            tuple is returned.
 
-        :return: a menu
+        :return: a tuple with one tuple for every visible menu item, which can
+            be compared to a previous state
         """
         if not descriptors:
+            return ()
+
+        return tuple(
+            (descriptor,)
+            if descriptor is _base.Menu.SEPARATOR
+            else (
+                descriptor,
+                descriptor.text,
+                descriptor.default,
+                descriptor.checked,
+                descriptor.radio,
+                descriptor.enabled,
+                self._resolve_menu(descriptor.submenu))
+            for descriptor in descriptors)
+
+    def _menu_layout(self, menu_state):
+        """Extracts the layout of a resolved menu state.
+
+        Two menu states with the same layout have the same menu items and
+        submenus in the same order, and differ only in the text and state of
+        the items.
+
+        :param menu_state: The menu state, as returned by
+            :meth:`_resolve_menu`.
+
+        :return: a value that can be compared to a previous layout
+        """
+        return tuple(
+            item_state
+            if len(item_state) == 1
+            else (item_state[0], self._menu_layout(item_state[6]))
+            for item_state in menu_state)
+
+    def _update_menu_items(self, hmenu, old_state, new_state, identifiers):
+        """Updates the text and state of existing menu items.
+
+        The menu states must have the same layout, as returned by
+        :meth:`_menu_layout`. Only items whose text or state has changed are
+        updated.
+
+        :param hmenu: The root menu handle.
+
+        :param old_state: The menu state used to create the native menu.
+
+        :param new_state: The current menu state.
+
+        :param identifiers: An iterator yielding the menu item IDs in the
+            order they were assigned by :meth:`_create_menu`.
+        """
+        for old_item_state, new_item_state in zip(old_state, new_state):
+            identifier = next(identifiers)
+            if len(new_item_state) == 1:
+                continue
+
+            if old_item_state[1:6] != new_item_state[1:6]:
+                menu_item = win32.MENUITEMINFO(
+                    cbSize=win32.SIZEOF_MENUITEMINFO,
+                    fMask=win32.MIIM_STRING | win32.MIIM_STATE
+                    | win32.MIIM_FTYPE)
+                self._fill_menu_item_state(menu_item, new_item_state)
+                win32.SetMenuItemInfo(
+                    hmenu, identifier, False, ctypes.byref(menu_item))
+
+            self._update_menu_items(
+                hmenu, old_item_state[6], new_item_state[6], identifiers)
+
+    def _create_menu(self, menu_state, callbacks):
+        """Creates a :class:`ctypes.wintypes.HMENU` from a resolved menu
+        state.
+
+        :param menu_state: The menu state, as returned by
+            :meth:`_resolve_menu`. If this is empty, ``None`` is returned.
+
+        :param callbacks: A mapping from menu item ID to callback, to which
+            every menu item created is added.
+
+        :return: a menu
+        """
+        if not menu_state:
             return None
 
         else:
-            # Generate the menu
+            # Generate the menu; the menu item structures of one menu level
+            # are allocated together
             hmenu = win32.CreatePopupMenu()
-            for i, descriptor in enumerate(descriptors):
-                # Append the callbacks before creating the menu items to ensure
-                # that the first item gets the ID 1
-                callbacks.append(self._handler(descriptor))
-                menu_item = self._create_menu_item(descriptor, callbacks)
-                win32.InsertMenuItem(hmenu, i, True, ctypes.byref(menu_item))
+            menu_items = (win32.MENUITEMINFO * len(menu_state))()
+            for i, item_state in enumerate(menu_state):
+                # Menu item IDs start at 1, since TrackPopupMenuEx returns 0
+                # when no item is selected
+                identifier = len(callbacks) + 1
+                callbacks[identifier] = self._handler(item_state[0])
+                menu_item = menu_items[i]
+                self._fill_menu_item(
+                    menu_item, item_state, identifier, callbacks)
+                if not win32.InsertMenuItem(
+                        hmenu, i, True, ctypes.byref(menu_item)):
+                    raise ctypes.WinError(ctypes.get_last_error())
 
             return hmenu
 
-    def _create_menu_item(self, descriptor, callbacks):
-        """Creates a :class:`pystray._util.win32.MENUITEMINFO` from a
-        :class:`pystray.MenuItem` instance.
+    def _fill_menu_item(self, menu_item, item_state, identifier, callbacks):
+        """Fills a :class:`pystray._util.win32.MENUITEMINFO` from a resolved
+        menu item state.
+
+        :param menu_item: The zero-initialised menu item structure to fill.
 
-        :param descriptor: The menu item descriptor.
+        :param item_state: The menu item state, as an item of the value
+            returned by :meth:`_resolve_menu`.
 
-        :param callbacks: A list to which a callback is appended for every menu
-            item created. The menu item IDs correspond to the items in this
-            list plus one.
+        :param int identifier: The menu item ID.
 
-        :return: a :class:`pystray._util.win32.MENUITEMINFO`
+        :param callbacks: A mapping from menu item ID to callback, to which
+            the items of any submenu are added.
         """
-        if descriptor is _base.Menu.SEPARATOR:
-            return win32.MENUITEMINFO(
-                cbSize=ctypes.sizeof(win32.MENUITEMINFO),
-                fMask=win32.MIIM_FTYPE,
-                fType=win32.MFT_SEPARATOR)
+        menu_item.cbSize = win32.SIZEOF_MENUITEMINFO
+        if len(item_state) == 1:
+            menu_item.fMask = win32.MIIM_FTYPE
+            menu_item.fType = win32.MFT_SEPARATOR
 
         else:
-            return win32.MENUITEMINFO(
-                cbSize=ctypes.sizeof(win32.MENUITEMINFO),
-                fMask=win32.MIIM_ID | win32.MIIM_STRING | win32.MIIM_STATE
-                | win32.MIIM_FTYPE | win32.MIIM_SUBMENU,
-                wID=len(callbacks),
-                dwTypeData=descriptor.text,
-                fState=0
-                | (win32.MFS_DEFAULT if descriptor.default else 0)
-                | (win32.MFS_CHECKED if descriptor.checked else 0)
-                | (win32.MFS_DISABLED if not descriptor.enabled else 0),
-                fType=0
-                | (win32.MFT_RADIOCHECK if descriptor.radio else 0),
-                hSubMenu=self._create_menu(descriptor.submenu, callbacks)
-                if descriptor.submenu
-                else None)
-
-    def _message(self, code, flags, **kwargs):
+            menu_item.fMask = win32.MIIM_ID | win32.MIIM_STRING \
+                | win32.MIIM_STATE | win32.MIIM_FTYPE | win32.MIIM_SUBMENU
+            menu_item.wID = identifier
+            self._fill_menu_item_state(menu_item, item_state)
+            menu_item.hSubMenu = self._create_menu(item_state[6], callbacks)
+
+    def _fill_menu_item_state(self, menu_item, item_state):
+        """Fills the text, state and type of a
+        :class:`pystray._util.win32.MENUITEMINFO` from a resolved menu item
+        state.
+
+        :param menu_item: The menu item structure to fill.
+
+        :param item_state: The menu item state, as an item of the value
+            returned by :meth:`_resolve_menu`. This must not be a separator.
+        """
+        _, text, default, checked, radio, enabled, _ = item_state
+        menu_item.dwTypeData = text
+        menu_item.fState = 0 \
+            | (win32.MFS_DEFAULT if default else 0) \
+            | (win32.MFS_CHECKED if checked else 0) \
+            | (win32.MFS_DISABLED if not enabled else 0)
+        menu_item.fType = 0 \
+            | (win32.MFT_RADIOCHECK if radio else 0)
+
+    def _message(self, code, flags):
         """Sends a message the the systray icon.
 
-        This method adds ``cbSize``, ``hWnd``, ``hId`` and ``uFlags`` to the
-        message data.
+        The message data is kept between calls; this method updates ``uFlags``
+        and the fields named by ``flags`` that reflect the icon state:
+        ``hIcon`` is set from the cached icon handle if ``flags`` contains
+        ``NIF_ICON``, and ``szTip`` is copied from the cached title buffer if
+        ``flags`` contains ``NIF_TIP``.
+
+        Other fields must be set by the caller while holding
+        :attr:`_notify_data_lock`.
 
         :param int message: The message to send. This should be one of the
             ``NIM_*`` constants.
 
         :param int flags: The value of ``NOTIFYICONDATAW::uFlags``.
-
-        :param kwargs: Data for the :class:`NOTIFYICONDATAW` object.
         """
-        win32.Shell_NotifyIcon(code, win32.NOTIFYICONDATAW(
-            cbSize=ctypes.sizeof(win32.NOTIFYICONDATAW),
-            hWnd=self._hwnd,
-            hID=id(self),
-            uFlags=flags,
-            **kwargs))
+        with self._notify_data_lock:
+            data = self._notify_data
+            data.uFlags = flags
+            if flags & win32.NIF_ICON:
+                data.hIcon = self._icon_handle
+            if flags & win32.NIF_TIP:
+                title_buffer = self._assert_title_buffer()
+                ctypes.memmove(
+                    ctypes.addressof(data)
+                    + win32.NOTIFYICONDATAW.szTip.offset,
+                    title_buffer,
+                    ctypes.sizeof(title_buffer))
+            win32.Shell_NotifyIcon(code, data)
+
+    def _assert_title_buffer(self):
+        """Asserts that the cached title buffer contains the current title.
+
+        The title is encoded only when it has changed since the buffer was
+        last generated.
+
+        :return: a buffer suitable for ``NOTIFYICONDATAW::szTip``
+        """
+        title = self.title
+        if self._title_buffer is None or self._title_buffer[0] != title:
+            self._title_buffer = (
+                title,
+                ctypes.create_unicode_buffer(title, 128))
+
+        return self._title_buffer[1]
 
     def _release_icon(self):
-        """Releases the icon handle and sets it to ``None``.
+        """Releases all cached icon handles and sets the current handle to
+        ``None``.
 
-        If not icon handle is set, no action is performed.
+        If no icon handles are cached, no action is performed.
         """
-        if self._icon_handle:
-            win32.DestroyIcon(self._icon_handle)
-            self._icon_handle = None
+        for icon_handle in self._icon_cache.values():
+            win32.DestroyIcon(icon_handle)
+        self._icon_cache.clear()
+        self._icon_handle = None
+        self._icon_key = None
 
     def _assert_icon_handle(self):
-        """Asserts that the cached icon handle exists.
+        """Asserts that the cached icon handle matches the current icon.
+
+        Icon handles are cached by the content of the image, so an image that
+        has been used recently is not loaded again.
+
+        This method must be called while holding :attr:`_notify_data_lock`,
+        since it may destroy icon handles.
         """
-        if self._icon_handle:
+        icon = self.icon
+
+        # The pixels of palette images are only indices, so the same data may
+        # represent different colours; hash the actual colours instead
+        data = icon.convert('RGBA') if icon.mode in ('P', 'PA') else icon
+        key = hashlib.blake2b(
+            b'%s:%dx%d:%r:' % (
+                (icon.mode.encode('ascii'),)
+                + icon.size
+                + (icon.info.get('transparency'),))
+            + data.tobytes(),
+            digest_size=16).digest()
+        if self._icon_handle and key == self._icon_key:
             return
 
-        with serialized_image(self.icon, 'ICO') as icon_path:
-            self._icon_handle = win32.LoadImage(
-                None,
-                icon_path,
-                win32.IMAGE_ICON,
-                0,
-                0,
-                win32.LR_DEFAULTSIZE | win32.LR_LOADFROMFILE)
+        try:
+            self._icon_handle = self._icon_cache.pop(key)
+
+        except KeyError:
+            self._icon_handle = self._load_icon(icon)
+
+        # Keep the most recently used handle last, and destroy the handles
+        # that have not been used for the longest time
+        self._icon_cache[key] = self._icon_handle
+        self._icon_key = key
+        while len(self._icon_cache) > self._ICON_CACHE_SIZE:
+            win32.DestroyIcon(self._icon_cache.popitem(last=False)[1])
+
+    def _load_icon(self, icon):
+        """Loads an icon handle from an image.
+
+        The image is serialised to an in-memory *ICO* file, and the entry best
+        matching the default icon size is loaded from it.
+
+        :param PIL.Image.Image icon: The image to load.
+
+        :return: an icon handle
+        """
+        b = io.BytesIO()
+        icon.save(b, format='ICO')
+        data = b.getvalue()
+
+        # Windows selects the best entry from a GRPICONDIR structure, which
+        # differs from the ICONDIR header of the file in that every entry has
+        # an identifier instead of an offset; we use the entry index plus one
+        reserved, type, count = struct.unpack_from('<HHH', data, 0)
+        entries = [
+            struct.unpack_from('<8sII', data, 6 + 16 * i)
+            for i in range(count)]
+        directory = struct.pack('<HHH', reserved, type, count) + b''.join(
+            struct.pack('<8sIH', header, size, i + 1)
+            for i, (header, size, offset) in enumerate(entries))
+        index = win32.LookupIconIdFromDirectoryEx(
+            directory,
+            True,
+            0,
+            0,
+            win32.LR_DEFAULTSIZE) - 1
+
+        _, size, offset = entries[index]
+        return win32.CreateIconFromResourceEx(
+            data[offset:offset + size],
+            size,
+            True,
+            win32.ICON_RESOURCE_VERSION,
+            0,
+            0,
+            win32.LR_DEFAULTSIZE)
 
     def _register_class(self):
         """Registers the systray window class.
@@ -371,17 +616,17 @@ class Icon(_base.Icon):
         :return: the class atom
         """
         return win32.RegisterClassEx(win32.WNDCLASSEX(
-            cbSize=ctypes.sizeof(win32.WNDCLASSEX),
+            cbSize=win32.SIZEOF_WNDCLASSEX,
             style=0,
             lpfnWndProc=_dispatcher,
             cbClsExtra=0,
             cbWndExtra=0,
-            hInstance=win32.GetModuleHandle(None),
+            hInstance=win32.HINSTANCE,
             hIcon=None,
             hCursor=None,
             hbrBackground=win32.COLOR_WINDOW + 1,
             lpszMenuName=None,
-            lpszClassName='%s%dSystemTrayIcon' % (self.name, id(self)),
+            lpszClassName='%s%dSystemTrayIcon' % (self.name, self._id),
             hIconSm=None))
 
     def _unregister_class(self, atom):
@@ -389,7 +634,7 @@ class Icon(_base.Icon):
 
         :param atom: The class atom returned by :meth:`_register_class`.
         """
-        win32.UnregisterClass(atom, win32.GetModuleHandle(None))
+        win32.UnregisterClass(atom, win32.HINSTANCE)
 
 
 @win32.WNDPROC
@@ -403,14 +648,31 @@ def _dispatcher(hwnd, uMsg, wParam, lParam):
     if uMsg == win32.WM_CREATE:
         return 0
 
-    try:
-        icon = Icon._HWND_TO_ICON[hwnd]
-    except KeyError:
+    # Moving the mouse over the icon causes a stream of notifications that are
+    # ignored by Icon._on_notify, so drop them before looking up the icon
+    if uMsg == win32.WM_NOTIFY \
+            and lParam != win32.WM_LBUTTONUP \
+            and lParam != win32.WM_RBUTTONUP:
+        return 0
+
+    icon = Icon._HWND_TO_ICON.get(hwnd)
+    if icon is None:
+        return win32.DefWindowProc(hwnd, uMsg, wParam, lParam)
+
+    # The private messages are consecutive, so look them up by offset
+    index = uMsg - win32.WM_STOP
+    handlers = icon._handlers
+    if 0 <= index < len(handlers):
+        handler = handlers[index]
+    elif uMsg == win32.WM_DISPLAYCHANGE:
+        handler = icon._on_display_change
+    elif uMsg == win32.WM_TASKBARCREATED:
+        handler = icon._on_taskbarcreated
+    else:
         return win32.DefWindowProc(hwnd, uMsg, wParam, lParam)
 
     try:
-        return int(icon._message_handlers.get(
-            uMsg, lambda w, l: 0)(wParam, lParam) or 0)
+        return handler(wParam, lParam)
 
     except:
         icon._log.error(
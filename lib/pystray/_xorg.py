@@ -15,29 +15,21 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import collections
 import contextlib
 import functools
-import six
+import os
+import select
 import sys
 import threading
-import types
 
 import PIL
 import Xlib.display
-import Xlib.threaded
 import Xlib.XK
 
-from six.moves import queue
-
 from . import _base
 
 
-# Create a display to verify that we have an X connection
-display = Xlib.display.Display()
-display.close()
-del display
-
-
 class XError(Exception):
     """An error that is thrown at the end of a code block managed by a
     :func:`display_manager` if an *X* error occurred.
@@ -46,7 +38,7 @@ class XError(Exception):
 
 
 @contextlib.contextmanager
-def display_manager(display):
+def display_manager(display, synchronize=True):
     """Traps *X* errors and raises an :class:`XError` at the end if any
     error occurred.
 
@@ -54,6 +46,11 @@ def display_manager(display):
     managed is sync'd.
 
     :param Xlib.display.Display display: The *X* display.
+
+    :param bool synchronize: Whether to wait for the *X* server to process all
+        requests when the block is exited. If this is ``False``, the requests
+        are only flushed; this is suitable for nested blocks, since errors are
+        then reported by the outermost block.
     """
     errors = []
 
@@ -63,7 +60,10 @@ def display_manager(display):
     old_handler = display.set_error_handler(handler)
     try:
         yield
-        display.sync()
+        if synchronize:
+            display.sync()
+        else:
+            display.flush()
     finally:
         display.set_error_handler(old_handler)
     if errors:
@@ -74,8 +74,18 @@ class Icon(_base.Icon):
     _XEMBED_VERSION = 0
     _XEMBED_MAPPED = 1
 
+    #: The value of the ``_XEMBED_INFO`` property of the icon window
+    _XEMBED_INFO_DATA = (_XEMBED_VERSION, _XEMBED_MAPPED)
+
     _SYSTEM_TRAY_REQUEST_DOCK = 0
 
+    #: The maximum number of scaled versions of the icon image to keep
+    _ICON_DATA_CACHE_SIZE = 4
+
+    #: The interval, in seconds, between attempts to dock a visible icon when
+    #: there is no systray
+    _DOCK_RETRY_INTERVAL = 5.0
+
     # We support only the default action
     HAS_MENU = False
 
@@ -91,21 +101,48 @@ class Icon(_base.Icon):
         #: The properly scaled version of the icon image
         self._icon_data = None
 
+        #: Recently used scaled versions of the icon image, keyed by size
+        self._icon_data_cache = collections.OrderedDict()
+
         #: The window currently embedding this icon
         self._systray_manager = None
 
-        # This is a mapping from X event codes to handlers used by the mainloop
-        self._message_handlers = {
+        #: Whether the icon should be docked; this is maintained by the
+        #: mainloop thread, since :attr:`visible` is updated only once the
+        #: forwarded call to :meth:`_show` has returned
+        self._dock_wanted = False
+
+        #: The last known size of the window
+        self._window_size = None
+
+        #: Whether the window must be redrawn once the current burst of events
+        #: has been handled
+        self._redraw = False
+        # This is a table from X event codes to handlers used by the mainloop;
+        # core event codes are small, so the table is indexed by event code
+        message_handlers = {
             Xlib.X.ButtonPress: self._on_button_press,
-            Xlib.X.ConfigureNotify: self._on_expose,
+            Xlib.X.ConfigureNotify: self._on_configure_notify,
             Xlib.X.DestroyNotify: self._on_destroy_notify,
             Xlib.X.Expose: self._on_expose}
+        self._message_handlers = tuple(
+            message_handlers.get(event_type)
+            for event_type in range(Xlib.X.LASTEvent))
 
-        self._queue = queue.Queue()
+        #: The calls from other threads waiting to be executed by the mainloop;
+        #: every item is the tuple ``(original, done, result)``, where ``done``
+        #: is an event set once ``result`` has been populated
+        self._pending = collections.deque()
 
         # Connect to X
         self._display = Xlib.display.Display()
 
+        # A byte is written to this pipe to wake the mainloop when a call is
+        # added to _pending; it is created only once connected, so that it is
+        # not leaked if connecting fails
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+
         with display_manager(self._display):
             # Create the atoms; some of these are required when creating
             # the window
@@ -134,11 +171,14 @@ class Icon(_base.Icon):
 
         finally:
             self._display.close()
+            os.close(self._wake_r)
+            os.close(self._wake_w)
 
     def _show(self):
         """The implementation of :meth:`_show`, executed in the mainloop
         thread.
         """
+        self._dock_wanted = True
         try:
             self._assert_docked()
         except AssertionError:
@@ -151,6 +191,7 @@ class Icon(_base.Icon):
         """The implementation of :meth:`_hide`, executed in the mainloop
         thread.
         """
+        self._dock_wanted = False
         if self._systray_manager:
             self._undock_window()
 
@@ -166,9 +207,10 @@ class Icon(_base.Icon):
                 'Failed to dock icon', exc_info=True)
             return
 
-        # Setting _icon_data to None will force regeneration of the icon
+        # Clearing the cached icon data will force regeneration of the icon
         # from _icon
         self._icon_data = None
+        self._icon_data_cache.clear()
         self._draw()
         self._icon_valid = True
 
@@ -184,10 +226,12 @@ class Icon(_base.Icon):
         pass
 
     def _run(self):
+        # The setup thread started by _mark_ready may call methods that must
+        # know the mainloop thread
+        self._thread = threading.current_thread()
         self._mark_ready()
 
         # Run the event loop
-        self._thread = threading.current_thread()
         self._mainloop()
 
     def _run_detached(self):
@@ -205,14 +249,35 @@ class Icon(_base.Icon):
         This method retrieves all events from *X* and makes sure to dispatch
         clicks.
         """
+        message_handlers = self._message_handlers
         try:
-            for event in self._events():
-                # If the systray window is destroyed, the icon has been hidden
-                if (event.type == Xlib.X.DestroyNotify and
-                        event.window == self._window):
-                    break
-
-                self._message_handlers.get(event.type, lambda e: None)(event)
+            for burst in self._events():
+                self._execute_pending()
+
+                for event in burst:
+                    # If the systray window is destroyed, the icon has been
+                    # hidden
+                    if (event.type == Xlib.X.DestroyNotify and
+                            event.window == self._window):
+                        return
+
+                    # Extension events have codes outside of the table
+                    if event.type < Xlib.X.LASTEvent:
+                        handler = message_handlers[event.type]
+                        if handler is not None:
+                            handler(event)
+
+                # Redraw at most once per burst, since the window manager may
+                # send a large number of exposure events when reparenting
+                if self._redraw:
+                    self._redraw = False
+                    self._draw()
+
+                # An empty burst means that waiting timed out or that calls
+                # were executed; in either case, retry docking if required
+                if (not burst and self._dock_wanted and
+                        not self._systray_manager):
+                    self._dock_window()
 
         except:
             self._log.error(
@@ -246,16 +311,30 @@ class Icon(_base.Icon):
             self._log.error(
                 'Failed to dock icon', exc_info=True)
 
+    def _on_configure_notify(self, event):
+        """Handles ``Xlib.X.ConfigureNotify``.
+
+        This method schedules a redraw of the window if its size has changed.
+        """
+        # Redraw only our own window
+        if event.window.id != self._window.id:
+            return
+
+        window_size = (event.width, event.height)
+        if window_size != self._window_size:
+            self._window_size = window_size
+            self._redraw = True
+
     def _on_expose(self, event):
-        """Handles ``Xlib.X.ConfigureNotify`` and ``Xlib.X.Expose``.
+        """Handles ``Xlib.X.Expose``.
 
-        This method redraws the window.
+        This method schedules a redraw of the window.
         """
         # Redraw only our own window
         if event.window.id != self._window.id:
             return
 
-        self._draw()
+        self._redraw = True
 
     def _create_atoms(self):
         """Creates the atoms used by the *XEMBED* and *systray* specifications.
@@ -274,63 +353,69 @@ class Icon(_base.Icon):
 
         :param args: The methods to rewrite.
         """
-        def dispatcher(original, atom):
+        pending = self._pending
+        wake_w = self._wake_w
+
+        def dispatcher(original):
+            # The replacement is stored on the instance, so it is a plain
+            # function closing over the icon rather than a bound method
             @functools.wraps(original)
-            def inner(self):
+            def inner():
                 # Just invoke the method if we are currently in the correct
                 # thread
-                if threading.current_thread().ident == self._thread.ident:
+                if threading.current_thread() is self._thread:
                     original()
                 else:
-                    self._send_message(self._window, atom)
-                    self._display.flush()
+                    done = threading.Event()
+                    result = []
+                    pending.append((original, done, result))
+                    os.write(wake_w, b'\0')
 
                     # Wait for the mainloop to execute the actual method, wait
                     # for completion and reraise any exceptions
-                    result = self._queue.get()
-                    if result is not True:
-                        six.reraise(*result)
-
-            return types.MethodType(inner, self)
+                    done.wait()
+                    if result[0] is not True:
+                        _, value, traceback = result[0]
+                        raise value.with_traceback(traceback)
 
-        def wrapper(original):
-            @functools.wraps(original)
-            def inner():
-                try:
-                    original()
-                    self._queue.put(True)
-                except:
-                    self._queue.put(sys.exc_info())
             return inner
 
-        def on_client_message(event):
-            handlers.get(event.client_type, lambda: None)()
-
-        # Create the atoms and a mapping from atom to actual implementation
-        atoms = [
-            self._display.intern_atom(
-                '_PYSTRAY_%s' % original.__name__.upper())
-            for original in args]
-        handlers = {
-            atom: wrapper(original)
-            for original, atom in zip(args, atoms)}
-
         # Replace the old methods
-        for original, atom in zip(args, atoms):
+        for original in args:
             setattr(
                 self,
                 original.__name__,
-                dispatcher(original, atom))
+                dispatcher(original))
 
-        # Make sure that we handle ClientMessage
-        self._message_handlers[Xlib.X.ClientMessage] = on_client_message
+    def _execute_pending(self):
+        """Executes the calls queued by other threads.
+
+        This method must be called from the mainloop thread.
+        """
+        # Empty the pipe before executing the calls; a call added after this
+        # point will wake the mainloop again
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        while self._pending:
+            original, done, result = self._pending.popleft()
+            try:
+                original()
+                result.append(True)
+            except:
+                result.append(sys.exc_info())
+            finally:
+                done.set()
 
     def _create_window(self):
         """Creates the system tray icon window.
 
         :return: a window
         """
-        with display_manager(self._display):
+        with display_manager(self._display, synchronize=False):
             # Create the window
             screen = self._display.screen()
             window = screen.root.create_window(
@@ -347,9 +432,11 @@ class Icon(_base.Icon):
                 min_height=24)
 
             # Enable XEMBED for the window
-            window.change_property(self._xembed_info, self._xembed_info, 32, [
-                self._XEMBED_VERSION,
-                self._XEMBED_MAPPED])
+            window.change_property(
+                self._xembed_info,
+                self._xembed_info,
+                32,
+                self._XEMBED_INFO_DATA)
 
             return window
 
@@ -369,22 +456,30 @@ class Icon(_base.Icon):
         """Asserts that the cached icon data matches the requested dimensions.
 
         If no cached icon data exists, or its dimensions do not match the
-        requested size, the image is generated.
+        requested size, the image is generated, unless an image of the
+        requested size has been generated recently.
 
         :param int width: The requested width.
 
         :param int height: The requested height.
         """
-        if self._icon_data and self._icon_data.size == (width, height):
+        size = (width, height)
+        if self._icon_data and self._icon_data.size == size:
             return
 
-        self._icon_data = PIL.Image.new(
-            'RGB',
-            (width, height))
-        self._icon_data.paste(self._icon.resize(
-            (width, height),
-            PIL.Image.LANCZOS))
-        self._icon_data.tostring = self._icon_data.tobytes
+        try:
+            self._icon_data = self._icon_data_cache.pop(size)
+
+        except KeyError:
+            self._icon_data = self._icon.resize(
+                size,
+                PIL.Image.LANCZOS).convert('RGB')
+
+        # Keep the most recently used size last, and discard the sizes that
+        # have not been used for the longest time
+        self._icon_data_cache[size] = self._icon_data
+        while len(self._icon_data_cache) > self._ICON_DATA_CACHE_SIZE:
+            self._icon_data_cache.popitem(last=False)
 
     def _assert_docked(self):
         """Asserts that the icon is docked in the systray.
@@ -442,13 +537,10 @@ class Icon(_base.Icon):
         :return: the window owning the selection, or ``None`` if no window owns
             it
         """
-        self._display.grab_server()
-        try:
-            systray_manager = self._display.get_selection_owner(
-                self._net_system_tray_sx)
-        finally:
-            self._display.ungrab_server()
-        self._display.flush()
+        # The selection owner is read in a single request, so there is no need
+        # to grab the server
+        systray_manager = self._display.get_selection_owner(
+            self._net_system_tray_sx)
 
         if systray_manager != Xlib.X.NONE:
             return self._display.create_resource_object(
@@ -480,11 +572,24 @@ class Icon(_base.Icon):
             event_mask=Xlib.X.NoEventMask)
 
     def _events(self):
-        """Yields all events.
+        """Yields all events in bursts.
+
+        Every burst is a list of the events received since the previous burst.
+        A burst is empty if the mainloop was woken only to execute calls from
+        other threads, or if the icon should be docked but is not and
+        :attr:`_DOCK_RETRY_INTERVAL` has passed without any events.
         """
+        display = self._display
         while True:
-            event = self._display.next_event()
-            if not event:
-                break
-            else:
-                yield event
+            # Send the requests made while handling the previous burst, and
+            # wait only if no events have been received already
+            display.flush()
+            count = display.pending_events()
+            if not count:
+                timeout = self._DOCK_RETRY_INTERVAL \
+                    if self._dock_wanted and not self._systray_manager \
+                    else None
+                select.select([display, self._wake_r], [], [], timeout)
+                count = display.pending_events()
+
+            yield [display.next_event() for _ in range(count)]
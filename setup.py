@@ -20,8 +20,7 @@ AUTHOR_EMAIL = 'moses.palmer@gmail.com'
 
 #: The runtime requirements
 RUNTIME_PACKAGES = [
-    'Pillow',
-    'six']
+    'Pillow']
 
 #: Additional requirements used during setup
 SETUP_PACKAGES = RUNTIME_PACKAGES + [
@@ -32,7 +31,7 @@ EXTRA_PACKAGES = {
     ':sys_platform == "darwin"': [
         'pyobjc-framework-Quartz >=7.0'],
     ':sys_platform == "linux"': [
-        'python-xlib >=0.17']}
+        'python-xlib >=0.22']}
 
 
 # Read globals from ._info without loading it
@@ -84,6 +83,7 @@ setuptools.setup(
     description='Provides systray integration',
     long_description=README + '\n\n' + CHANGES,
 
+    python_requires='>=3.6',
     install_requires=RUNTIME_PACKAGES,
     setup_requires=RUNTIME_PACKAGES + SETUP_PACKAGES,
     extras_require=EXTRA_PACKAGES,
@@ -113,5 +113,5 @@ setuptools.setup(
         'Operating System :: Microsoft :: Windows :: Windows NT/2000',
         'Operating System :: POSIX',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.4'])
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only'])
@@ -15,19 +15,18 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from __future__ import print_function
-
+import functools
 import itertools
 
 from PIL import Image, ImageDraw
-from six.moves import input
 
 import pystray
 
 from pystray import MenuItem as item
 
 
-COLORS = itertools.cycle((
+#: The colours used for generated images, in pairs
+COLORS = (
     'black',
     'white',
 
@@ -38,7 +37,17 @@ COLORS = itertools.cycle((
     'red',
 
     'green',
-    'white'))
+    'white')
+
+#: The source of indices into :data:`COLORS`
+_COLOR_INDICES = itertools.count()
+
+
+class Colors(tuple):
+    """A pair of colours, stringified as a phrase suitable for printing.
+    """
+    def __str__(self):
+        return ' and '.join(self)
 
 
 def say(*args, **kwargs):
@@ -88,23 +97,40 @@ def image(width=64, height=64):
         *PIL* colour names, suitable for printing; the stringification of
         the tuple is also suitable for printing
     """
-    class Colors(tuple):
-        def __str__(self):
-            return ' and '.join(self)
-
     colors = Colors((next_color(), next_color()))
-    img = Image.new('RGB', (width, height), colors[0])
+    return _image(width, height, *colors).copy(), colors
+
+
+@functools.lru_cache(maxsize=16)
+def _image(width, height, color0, color1):
+    """Draws an icon image.
+
+    Since the colours are reused, the images are cached; callers must copy
+    the returned image, since *PIL* images are mutable.
+
+    :param int width: The width of the image.
+
+    :param int height: The height of the image.
+
+    :param str color0: The background colour.
+
+    :param str color1: The colour of the checkered squares.
+
+    :return: a *PIL* image
+    """
+    img = Image.new('RGB', (width, height), color0)
     dc = ImageDraw.Draw(img)
 
-    dc.rectangle((width // 2, 0, width, height // 2), fill=colors[1])
-    dc.rectangle((0, height // 2, width // 2, height), fill=colors[1])
+    dc.rectangle((width // 2, 0, width, height // 2), fill=color1)
+    dc.rectangle((0, height // 2, width // 2, height), fill=color1)
+
+    return img
 
-    return img, colors
 
 def next_color():
     """Returns the next colour to use.
     """
-    return next(COLORS)
+    return COLORS[next(_COLOR_INDICES) % len(COLORS)]
 
 
 def confirm(self, statement, *fmt):
@@ -121,10 +147,10 @@ def confirm(self, statement, *fmt):
 
     message = ('\n' + statement % fmt) + ' '
     while True:
-        response = input(message)
-        if response.lower() in valid_responses:
+        response = input(message).lower()
+        if response in valid_responses:
             self.assertIn(
-                response.lower(), accept_responses,
+                response, accept_responses,
                 'User declined statement "%s"' % message)
             return
         else:
@@ -15,13 +15,12 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import queue
 import sys
 import unittest
 
 import pystray
 
-from six.moves import queue
-from six import reraise
 from time import sleep
 
 from pystray import Menu as menu, MenuItem as item
@@ -43,20 +42,22 @@ def test(icon):
     anything.
     """
     def inner(f):
-        q = queue.Queue()
+        # The result is stored before the icon is stopped, and run only
+        # returns once it has been, so no synchronisation is required
+        results = []
         def setup(icon):
             try:
                 f()
-                q.put(True)
+                results.append(True)
             except:
-                q.put(sys.exc_info())
+                results.append(sys.exc_info())
             finally:
                 icon.visible = False
                 icon.stop()
         icon.run(setup=setup)
-        result = q.get()
+        result, = results
         if result is not True:
-            reraise(*result)
+            raise result[1].with_traceback(result[2])
 
     return inner
 
@@ -408,7 +409,7 @@ class IconTest(unittest.TestCase):
         ico, colors = icon(menu=menu(
             item('Item 1', on_activate),
             item('Item 2', None),
-            item(lambda _:'Item ' + str(q.ticks + 3), None)))
+            item(lambda _: 'Item %d' % (q.ticks + 3), None)))
 
         @test(ico)
         def _():